@@ -1,24 +1,40 @@
 """
 API routes: /api/products and /api/chat
 """
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, HTTPException, Request, Response
+from typing import List, Optional
 from app.models.schemas import ChatRequest, ChatResponse, Product
 from app.services.chatbot_service import generate_chat_response
-from app.services.product_service import fetch_products
+from app.services.product_service import fetch_products, get_products_json
 
 router = APIRouter(prefix="/api", tags=["Chatbot"])
 
-@router.get("/products", response_model=List[Product])
-async def get_products():
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison: any listed tag (W/ prefix ignored) or "*"."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+# response_model is documented only; the body is not re-validated per request
+@router.get("/products", responses={200: {"model": List[Product]}})
+async def get_products(request: Request):
     """
     GET /api/products
     Returns the list of products fetched from DummyJSON.
+    The JSON body is serialized once per cache load and served as-is.
     """
     products = await fetch_products()
     if not products:
         raise HTTPException(status_code=404, detail="No products found")
-    return products
+    body, etag, last_modified = get_products_json()
+    headers = {"ETag": etag, "Last-Modified": last_modified}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
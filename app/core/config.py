@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import AnyUrl
+from typing import Optional
 
 class Settings(BaseSettings):
     """
@@ -11,6 +12,17 @@ class Settings(BaseSettings):
     DUMMYJSON_URL: AnyUrl
     HOST: str = "0.0.0.0"
     PORT: int = 8000
+    # `python -m app.main`: RELOAD=true for development (single process);
+    # otherwise WORKERS processes (default: one per CPU) on uvloop/httptools
+    RELOAD: bool = False
+    WORKERS: Optional[int] = None
+    # Groq reply cache: Redis when REDIS_URL is set, otherwise in-process
+    REDIS_URL: Optional[str] = None
+    GROQ_CACHE_TTL: int = 3600
+    # seconds between background refreshes of the DummyJSON product cache
+    PRODUCTS_CACHE_TTL: int = 3600
+    # seconds to wait for Groq on a product question before replying with the local summary
+    GROQ_SOFT_TIMEOUT: float = 6.0
 
     class Config:
         env_file = ".env"
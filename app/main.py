@@ -2,6 +2,8 @@ import logging
 from fastapi import FastAPI
 from app.api import routes_chatbot
 from app.core.config import settings
+from app.services.product_service import start_refresher, stop_refresher
+from app.utils.groq_client import batcher, init_http_session, close_http_session, close_cache
 from fastapi.middleware.cors import CORSMiddleware
 
 logging.basicConfig(level=logging.INFO)
@@ -24,10 +26,37 @@ app.add_middleware(
 
 app.include_router(routes_chatbot.router)
 
+@app.on_event("startup")
+async def startup():
+    # one keep-alive HTTP session shared by all Groq calls
+    await init_http_session()
+    batcher.start()
+    # warm the product cache in the background; requests never wait on DummyJSON after this
+    start_refresher()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_refresher()
+    await batcher.stop()
+    await close_http_session()
+    await close_cache()
+
 @app.get("/")
 async def root():
     return {"message": "Product Chatbot API is running. Open /docs for interactive docs."}
 
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run("app.main:app", host=settings.HOST, port=settings.PORT, reload=True)
+    if settings.RELOAD:
+        uvicorn.run("app.main:app", host=settings.HOST, port=settings.PORT, reload=True)
+    else:
+        # "auto" picks uvloop / httptools when installed (uvloop is not available on Windows)
+        uvicorn.run(
+            "app.main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            workers=settings.WORKERS or os.cpu_count(),
+            loop="auto",
+            http="auto",
+        )
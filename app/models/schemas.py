@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, model_validator
 from typing import Optional, List
 
 class ChatRequest(BaseModel):
@@ -7,7 +7,12 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     response: str
 
+_PRODUCT_DEFAULTS = {"description": "", "price": 0.0, "discountPercentage": 0.0, "rating": 0.0, "stock": 0}
+
 class Product(BaseModel):
+    # built once per cache load and shared by every request; never mutated
+    model_config = ConfigDict(frozen=True)
+
     id: int
     title: str
     description: str
@@ -19,6 +24,17 @@ class Product(BaseModel):
     category: Optional[str] = None
     thumbnail: Optional[str] = None
 
+    @model_validator(mode="before")
+    @classmethod
+    def _fill_missing(cls, data):
+        # DummyJSON occasionally omits these or sends null; keep them usable as numbers/strings
+        if isinstance(data, dict):
+            data = dict(data)
+            for field, default in _PRODUCT_DEFAULTS.items():
+                if data.get(field) is None:
+                    data[field] = default
+        return data
+
 class SearchFilters(BaseModel):
     category: Optional[str] = None
     min_price: Optional[float] = None
@@ -1,13 +1,27 @@
 import re
-from typing import Optional, List
+import asyncio
+import ahocorasick
+from array import array
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, Optional, List
 from app.services.product_service import (
     fetch_products,
     search_by_name,
     search_by_category,
     filter_products,
-    compute_actual_price
+    compute_actual_price,
+    get_title_lookup,
+    get_token_postings,
+    get_title_vocab,
+    get_title_automaton,
+    get_categories,
+    get_categories_display,
+    normalize_word as _normalize_word
 )
-from app.utils.groq_client import query_groq
+from app.core.config import settings
+from app.models.schemas import Product
+from app.utils.groq_client import FALLBACK_REPLY, query_groq
 
 # Intent keyword sets (simple, easy to extend)
 GREETINGS = {"hi", "hello", "hey", "good morning", "good afternoon", "good evening", "greetings"}
@@ -16,45 +30,201 @@ INQUIRY_PRICE = {"price", "cost", "how much", "what is the price", "priced"}
 INQUIRY_STOCK = {"stock", "available", "availability", "in stock"}
 INQUIRY_RATING = {"rating", "ratings", "review", "reviews", "stars"}
 INQUIRY_CATEGORY = {"category", "categories", "show me", "any", "do you have"}
+INTENTS = {
+    "greeting": GREETINGS,
+    "farewell": FAREWELL,
+    "price": INQUIRY_PRICE,
+    "stock": INQUIRY_STOCK,
+    "rating": INQUIRY_RATING,
+    "category": INQUIRY_CATEGORY,
+}
+# words the typo corrector must leave alone ("price" is not a misspelled "princess")
+_KEYWORDS = frozenset(k for keywords in INTENTS.values() for k in keywords)
+# everyday chat / shopping words that sit one edit away from a title word
+# ("apply" -> "apple", "chain" -> "chair"); also never typo-corrected
+_COMMON_WORDS = frozenset({
+    "about", "again", "apply", "brand", "bring", "chain", "cheap", "check", "cheer", "chose",
+    "color", "could", "coupon", "dried", "fresh", "given", "great", "greet", "honest", "juicy",
+    "money", "order", "other", "paper", "place", "plain", "plant", "prime", "print", "ready",
+    "right", "share", "shiny", "shirt", "small", "sound", "stake", "steal", "steam", "steel",
+    "still", "store", "sweet", "thank", "there", "these", "thing", "think", "those", "where",
+    "which", "while", "white", "would", "write",
+})
 
+# Single-word keywords are matched as whole message words (hash lookup, and
+# "hi" no longer fires inside "this"); only multi-word phrases need a text scan.
+def _index_word_intents() -> dict:
+    by_word = defaultdict(set)
+    for intent, keywords in INTENTS.items():
+        for k in keywords:
+            if " " not in k:
+                by_word[k].add(intent)
+    return {k: frozenset(v) for k, v in by_word.items()}
 
-def _is_greeting(message: str) -> bool:
-    m = message.lower()
-    return any(g in m for g in GREETINGS)
+_WORD_INTENTS = _index_word_intents()
+_PHRASE_INTENTS = tuple((k, intent) for intent, keywords in INTENTS.items() for k in keywords if " " in k)
 
-def _is_farewell(message: str) -> bool:
-    m = message.lower()
-    return any(g in m for g in FAREWELL)
+# Regexes used on every request, compiled once at import
+_RE_BETWEEN = re.compile(r'between\s+(\d+(?:\.\d+)?)\s+and\s+(\d+(?:\.\d+)?)', re.I)
+_RE_UNDER = re.compile(r'(?:under|below|less than)\s+\$?(\d+(?:\.\d+)?)', re.I)
+_RE_OVER = re.compile(r'(?:over|above|more than)\s+\$?(\d+(?:\.\d+)?)', re.I)
+_RE_RATING = re.compile(r'ratings?\s*(?:above|over|greater than)\s*(\d+(?:\.\d+)?)', re.I)
+_RE_CATEGORIES = re.compile(r'\b(categories|types of products|what.*categories)\b', re.I)
+_RE_TOKEN2 = re.compile(r"[A-Za-z0-9\-']{2,}")
 
-def _contains_keyword(message: str, keywords: set) -> bool:
-    m = message.lower()
-    return any(k in m for k in keywords)
+# Static prompt prefixes sent to Groq; the per-request part is appended at the
+# end so identical leading tokens can hit provider-side prompt caching.
+_PRODUCT_PROMPT_PREFIX = (
+    "You are a helpful and friendly e-commerce assistant. Use only the product facts below "
+    "to answer the customer's query naturally and helpfully.\n"
+    "Write a concise, friendly response (1–3 short paragraphs) that answers the user's question "
+    "using these facts. If the user is vague, offer helpful next steps or a follow-up question.\n\n"
+)
+_GENERIC_PROMPT_PREFIX = (
+    "You are a friendly shopping assistant.\n"
+    "If the message is not specifically about a product, reply in a short conversational way, "
+    "but avoid making up product facts. If unsure, offer guidance on what they can ask.\n\n"
+)
+
+# Groq calls that missed GROQ_SOFT_TIMEOUT; referenced here until they finish
+# so the event loop does not drop them before their reply is cached.
+_late_groq_tasks: set = set()
+
+# Typo tolerance: query tokens at least this long that are not title words get
+# snapped to a title word within _fuzzy_max_edits(tok) edits that starts with the
+# same letter, and only when no other title word is equally close. Shorter
+# tokens are left alone: at 4 letters too many everyday words ("tell", "been",
+# "door") sit one edit away from a title word.
+FUZZY_MIN_LEN = 5
+
+def _fuzzy_max_edits(tok: str) -> int:
+    return 1 if len(tok) <= 6 else 2
+
+
+@lru_cache(maxsize=1)
+def _build_automaton(categories: tuple) -> ahocorasick.Automaton:
+    """One Aho-Corasick automaton over every multi-word intent phrase and category name."""
+    labels = defaultdict(list)
+    for k, intent in _PHRASE_INTENTS:
+        labels[k].append(("intent", intent))
+    for c in categories:
+        labels[c].append(("category", c))
+    automaton = ahocorasick.Automaton()
+    for k, v in labels.items():
+        automaton.add_word(k, tuple(v))
+    automaton.make_automaton()
+    return automaton
+
+def _scan(lower_txt: str, words: frozenset, categories: tuple) -> dict:
+    """Returns matched intents and categories: word lookups plus one automaton pass."""
+    hits = {"intent": set(), "category": set()}
+    for w in words:
+        hits["intent"].update(_WORD_INTENTS.get(w, ()))
+    for _, matched in _build_automaton(categories).iter(lower_txt):
+        for kind, label in matched:
+            hits[kind].add(label)
+    return hits
+
+def _lev_bounded(a: str, b: str, bound: int) -> int:
+    """
+    Edit distance between a and b counting an adjacent transposition as one
+    edit (optimal string alignment), or bound + 1 as soon as it is known to
+    exceed bound. Keeps three DP rows of len(b) + 1.
+    """
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    if len(a) < len(b):
+        a, b = b, a
+    n = len(b)
+    before = array('i', [0]) * (n + 1)
+    prev = array('i', range(n + 1))
+    cur = array('i', [0]) * (n + 1)
+    prev_min = 0
+    for i, ca in enumerate(a, 1):
+        cur[0] = row_min = i
+        for j, cb in enumerate(b, 1):
+            d = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                d = min(d, before[j - 2] + 1)
+            cur[j] = d
+            if d < row_min:
+                row_min = d
+        # a transposition can skip one row, so stop only when two rows in a row are over
+        if row_min > bound and prev_min > bound:
+            return bound + 1
+        prev_min = row_min
+        before, prev, cur = prev, cur, before
+    return prev[n] if prev[n] <= bound else bound + 1
+
+def _closest_word(tok: str, vocab: Dict[str, List[str]]) -> Optional[str]:
+    bound = _fuzzy_max_edits(tok)
+    candidates = [w for w in vocab.get(tok[0], ()) if abs(len(w) - len(tok)) <= bound]
+    ranked = sorted((d, w) for w in candidates if (d := _lev_bounded(tok, w, bound)) <= bound)[:2]
+    if not ranked:
+        return None
+    if len(ranked) > 1 and ranked[1][0] == ranked[0][0]:
+        # two title words equally close: a guess would be a coin flip
+        return None
+    return ranked[0][1]
+
+def _correct_typos(tokens: frozenset, postings: dict, vocab: Dict[str, List[str]]) -> frozenset:
+    """
+    Replace unknown tokens with their closest title word (e.g. "iphoen" -> "iphone").
+    Returns tokens itself when nothing changes, which is the common case.
+    """
+    fixed = None
+    for tok in tokens:
+        if (tok not in postings and tok not in _KEYWORDS and tok not in _COMMON_WORDS
+                and len(tok) >= FUZZY_MIN_LEN):
+            word = _closest_word(tok, vocab)
+            if word:
+                if fixed is None:
+                    fixed = set(tokens)
+                fixed.discard(tok)
+                fixed.add(word)
+    return tokens if fixed is None else frozenset(fixed)
 
-def _normalize_word(word: str) -> str:
-    word = word.lower().strip()
-    # handle common plural endings
-    if word.endswith("ies") and len(word) > 4:
-        return word[:-3] + "y"
-    if word.endswith("oes") and len(word) > 4:
-        return word[:-2]
-    if word.endswith("ches") or word.endswith("shes") or word.endswith("xes"):
-        return word[:-2]
-    if word.endswith("ses") and len(word) > 4:
-        return word[:-2]
-    if word.endswith("s") and len(word) > 3:
-        return word[:-1]
-    return word
+def _match_product(products: List[Product], lower_txt: str, norm_words: List[str]) -> Optional[Product]:
+    """
+    Identify the product a message is about; each stage runs only if the
+    previous one found nothing.
+    """
+    # Exact title match (case-insensitive): one dict lookup
+    i = get_title_lookup().get(lower_txt)
+    if i is not None:
+        return products[i]
 
+    # Substring match (handles singular/plural normalization): one automaton
+    # pass finds every title the message contains; the earliest product wins
+    automaton = get_title_automaton()
+    if automaton is not None:
+        hits = [i for _, i in automaton.iter(" ".join(norm_words))]
+        if hits:
+            return products[min(hits)]
+
+    # Token-based fallback (with normalized, typo-corrected tokens)
+    postings = get_token_postings()
+    # built once per query; scoring is postings lookups, no per-product sets
+    query_tokens = frozenset(_normalize_word(t) for t in norm_words if len(t) >= 3)
+    query_tokens = _correct_typos(query_tokens, postings, get_title_vocab())
+    counter = Counter()
+    for tok in query_tokens:
+        counter.update(postings.get(tok, ()))
+    if not counter:
+        return None
+    # highest overlap wins; ties go to the earliest product, as before
+    best_score = max(counter.values())
+    return products[min(i for i, score in counter.items() if score == best_score)]
 
 def _extract_price_range(message: str):
     low = None; high = None
-    m = re.search(r'between\s+(\d+(?:\.\d+)?)\s+and\s+(\d+(?:\.\d+)?)', message, re.I)
+    m = _RE_BETWEEN.search(message)
     if m:
         return float(m.group(1)), float(m.group(2))
-    m = re.search(r'(?:under|below|less than)\s+\$?(\d+(?:\.\d+)?)', message, re.I)
+    m = _RE_UNDER.search(message)
     if m:
         return None, float(m.group(1))
-    m = re.search(r'(?:over|above|more than)\s+\$?(\d+(?:\.\d+)?)', message, re.I)
+    m = _RE_OVER.search(message)
     if m:
         return float(m.group(1)), None
     return None, None
@@ -67,49 +237,43 @@ async def generate_chat_response(message: str) -> str:
     if not txt:
         return "Sorry, I didn't receive a message. Please ask about a product or say 'hi'."
 
-    # 1) greetings / farewell
-    if _is_greeting(txt):
+    # Per-message text forms, computed once and reused below
+    lower_txt = txt.lower()
+    raw_words = _RE_TOKEN2.findall(lower_txt)
+    norm_words = [_normalize_word(w) for w in raw_words]
+    # raw and singular forms, so "prices" still asks about price
+    msg_words = frozenset(raw_words).union(norm_words)
+    rating_m = _RE_RATING.search(lower_txt)
+
+    # 1) one keyword pass for intents and category mentions
+    categories = get_categories()
+    hits = _scan(lower_txt, msg_words, categories)
+    intents = hits["intent"]
+
+    # greetings / farewell
+    if "greeting" in intents:
         return "Hello! 👋 How can I help you today? Ask about a product name, category, price range, or rating."
-    if _is_farewell(txt):
+    if "farewell" in intents:
         return "Goodbye! If you need anything else, just ask."
 
     # 2) load products
     products = await fetch_products()
     if not products:
         return "Sorry — I couldn't load products right now. Please try again later."
+    if get_categories() is not categories:
+        # cache was (re)loaded just now; rescan against the current categories
+        hits = _scan(lower_txt, msg_words, get_categories())
+        intents = hits["intent"]
 
     # 3) Product identification — smarter version with plural handling
-    lower_txt = txt.lower()
-    norm_txt = " ".join(_normalize_word(w) for w in re.findall(r"[A-Za-z0-9\-']{2,}", lower_txt))
-
-    # Exact title match (case-insensitive)
-    exact_matches = [p for p in products if p.title.lower() == lower_txt]
-
-    # Substring match (handles singular/plural normalization)
-    if not exact_matches:
-        exact_matches = [p for p in products if _normalize_word(p.title.lower()) in norm_txt]
-
-    # Token-based fallback (with normalized tokens)
-    if not exact_matches:
-        tokens = [_normalize_word(t) for t in re.findall(r"[A-Za-z0-9\-']{3,}", norm_txt)]
-        candidates = []
-        for p in products:
-            title_words = [_normalize_word(w) for w in p.title.lower().split()]
-            score = len(set(tokens) & set(title_words))
-            if score > 0:
-                candidates.append((score, p))
-        candidates.sort(reverse=True, key=lambda x: x[0])
-        if candidates:
-            exact_matches = [candidates[0][1]]
-
-    name_matches = exact_matches
+    # ("ratings above N" is always a filter query, so don't bother matching)
+    product = None if rating_m else _match_product(products, lower_txt, norm_words)
 
     # 6) If we found a product, answer
-    if name_matches and not re.search(r'ratings?\s*(?:above|over|greater than)\s*\d', txt, re.I):
-        product = name_matches[0]
-        wants_price = _contains_keyword(txt, INQUIRY_PRICE)
-        wants_stock = _contains_keyword(txt, INQUIRY_STOCK)
-        wants_rating = _contains_keyword(txt, INQUIRY_RATING)
+    if product:
+        wants_price = "price" in intents
+        wants_stock = "stock" in intents
+        wants_rating = "rating" in intents
 
         facts = {
             "name": product.title,
@@ -131,61 +295,64 @@ async def generate_chat_response(message: str) -> str:
         if wants_rating and not any([wants_price, wants_stock]):
             return f"{facts['name']} has an average rating of {facts['rating']} stars."
 
-        # Build a RAG prompt for Groq to craft a human-like reply
-        prompt = f"""
-        You are a helpful and friendly e-commerce assistant. Use only the facts below to answer the customer's query naturally and helpfully.
-        Customer message: "{message}"
-        
-        Product facts:
-        - Name: {facts['name']}
-        - Brand: {facts['brand']}
-        - Category: {facts['category']}
-        - Description: {facts['description']}
-        - Price: ${facts['price']:.2f}
-        - Discount: {facts['discount']:.2f}%
-        - Final price (after discount): ${facts['actual_price']:.2f}
-        - Rating: {facts['rating']}
-        - Stock: {facts['stock']}
-        
-        Write a concise, friendly response (1–3 short paragraphs) that answers the user's question using these facts. If the user is vague, offer helpful next steps or a follow-up question.
-        """
-        ai_resp = query_groq(prompt)
-        # If Groq fallback text, provide a local summary instead
-        if ai_resp.startswith("Sorry — I couldn't reach the AI service"):
-            return (f"{facts['name']} — {facts['description']} Price: ${facts['price']:.2f} "
-                    f"(after {facts['discount']:.2f}% off: ${facts['actual_price']:.2f}), "
-                    f"rating {facts['rating']}, stock {facts['stock']}.")
+        # Build a RAG prompt for Groq to craft a human-like reply: fixed
+        # instructions first, then only the per-request message and facts
+        prompt = _PRODUCT_PROMPT_PREFIX + "\n".join((
+            f'Customer message: "{message}"',
+            "",
+            "Product facts:",
+            f"- Name: {facts['name']}",
+            f"- Brand: {facts['brand']}",
+            f"- Category: {facts['category']}",
+            f"- Description: {facts['description']}",
+            f"- Price: ${facts['price']:.2f}",
+            f"- Discount: {facts['discount']:.2f}%",
+            f"- Final price (after discount): ${facts['actual_price']:.2f}",
+            f"- Rating: {facts['rating']}",
+            f"- Stock: {facts['stock']}",
+        ))
+        # Groq gets GROQ_SOFT_TIMEOUT seconds; if it misses that deadline (or
+        # fails) this local summary is the answer instead.
+        local_summary = (f"{facts['name']} — {facts['description']} Price: ${facts['price']:.2f} "
+                         f"(after {facts['discount']:.2f}% off: ${facts['actual_price']:.2f}), "
+                         f"rating {facts['rating']}, stock {facts['stock']}.")
+        groq_task = asyncio.create_task(query_groq(prompt))
+        done, _ = await asyncio.wait({groq_task}, timeout=settings.GROQ_SOFT_TIMEOUT)
+        if not done:
+            # let the late reply finish so query_groq still caches it for next time
+            _late_groq_tasks.add(groq_task)
+            groq_task.add_done_callback(_late_groq_tasks.discard)
+            return local_summary
+        ai_resp = groq_task.result()
+        if ai_resp == FALLBACK_REPLY:
+            return local_summary
         return ai_resp
 
     # 7) Handle category and filter-style queries (no single product mentioned)
 
     # detect if user is asking about categories
-    if re.search(r'\b(categories|types of products|what.*categories)\b', lower_txt):
-        categories = sorted(set((p.category or "unknown").capitalize() for p in products))
-        return "We currently offer products in these categories:\n- " + "\n- ".join(categories)
+    if _RE_CATEGORIES.search(lower_txt):
+        return "We currently offer products in these categories:\n- " + "\n- ".join(get_categories_display())
 
     # detect category mention (e.g., "show me groceries")
-    categories = sorted(set((p.category or "unknown").lower() for p in products))
-    for c in categories:
-        if c in lower_txt:
-            items = search_by_category(products, c)
-            if not items:
-                return f"Sorry — I couldn't find items in '{c}'."
-            lines = []
-            for it in items[:6]:
-                actual = compute_actual_price(it.price, it.discountPercentage or 0.0)
-                lines.append(
-                    f"{it.title} — ${actual:.2f} (orig ${it.price:.2f}, {it.discountPercentage}% off), "
-                    f"rating {it.rating}, stock {it.stock}"
-                )
-            return f"I found these items in *{c}*:\n" + "\n".join(lines)
+    if hits["category"]:
+        # several categories mentioned: the alphabetically first wins, as before
+        c = min(hits["category"])
+        items = search_by_category(products, c)
+        if not items:
+            return f"Sorry — I couldn't find items in '{c}'."
+        lines = []
+        for it in items[:6]:
+            actual = compute_actual_price(it.price, it.discountPercentage or 0.0)
+            lines.append(
+                f"{it.title} — ${actual:.2f} (orig ${it.price:.2f}, {it.discountPercentage}% off), "
+                f"rating {it.rating}, stock {it.stock}"
+            )
+        return f"I found these items in *{c}*:\n" + "\n".join(lines)
 
     # detect price or rating filters (e.g., "under 50", "rating above 4")
-    low, high = _extract_price_range(txt)
-    min_rating = None
-    m = re.search(r'ratings?\s*(?:above|over|greater than)\s*(\d+(?:\.\d+)?)', txt, re.I)
-    if m:
-        min_rating = float(m.group(1))
+    low, high = _extract_price_range(lower_txt)
+    min_rating = float(rating_m.group(1)) if rating_m else None
 
     filtered = filter_products(products, min_price=low, max_price=high, min_rating=min_rating)
     if filtered:
@@ -210,10 +377,5 @@ async def generate_chat_response(message: str) -> str:
 
 
     # 8) Unknown / fallback -> ask Groq for a short conversational reply
-    generic_prompt = f"""
-    You are a friendly shopping assistant.
-    The user said: "{message}"
-    If the message is not specifically about a product, reply in a short conversational way,
-    but avoid making up product facts. If unsure, offer guidance on what they can ask.
-    """
-    return query_groq(generic_prompt)
+    generic_prompt = _GENERIC_PROMPT_PREFIX + f'The user said: "{message}"'
+    return await query_groq(generic_prompt)
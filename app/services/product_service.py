@@ -2,48 +2,202 @@
 Product service: fetch products from DummyJSON with simple in-memory caching
 and helpers for searching / filtering.
 """
+import ahocorasick
 import aiohttp
-from typing import List, Optional
+import asyncio
+import hashlib
+import numpy as np
+import orjson
+from collections import defaultdict
+from email.utils import formatdate
+from pydantic import TypeAdapter
+from typing import Dict, List, Optional, Tuple
 from app.core.config import settings
 from app.models.schemas import Product
 
 # simple in-memory cache (process-local). Good enough for a single container dev env.
 _products_cache: Optional[List[Product]] = None
+# serializes fetches so concurrent cold-start requests share one DummyJSON call
+_fetch_lock = asyncio.Lock()
+_refresher: Optional[asyncio.Task] = None
+# validates the whole DummyJSON list in one pydantic-core call
+_PRODUCTS_ADAPTER = TypeAdapter(List[Product])
+# per-product lowercased / normalized title data, parallel to _products_cache
+_product_index: List[dict] = []
+# lowercased title -> position of the first product with that title
+_title_lookup: Dict[str, int] = {}
+# inverted index: normalized title token -> positions in _products_cache
+_token_postings: Dict[str, List[int]] = {}
+# distinct normalized title tokens by first letter, used as choices for
+# typo-tolerant matching (a correction never changes the first letter)
+_title_vocab: Dict[str, List[str]] = {}
+# Aho-Corasick automaton over normalized titles -> position of the first product
+# with that title; finds every title contained in a message in one pass
+_title_automaton: Optional[ahocorasick.Automaton] = None
+# sorted lowercase category names ("unknown" for products without one)
+_categories: Tuple[str, ...] = ()
+_categories_display: Tuple[str, ...] = ()
+# products grouped by lowercased category, for search_by_category on the cache
+_products_by_category: Dict[str, List[Product]] = {}
+# numeric columns (structure-of-arrays) parallel to _products_cache, for filter_products
+_prices = np.empty(0)
+_ratings = np.empty(0)
+# /api/products payload, serialized once per cache load, plus its cache validators
+_products_json: bytes = b"[]"
+_products_etag: str = ""
+_products_last_modified: str = ""
 
-async def fetch_products() -> List[Product]:
+def normalize_word(word: str) -> str:
+    word = word.lower().strip()
+    # handle common plural endings
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("oes") and len(word) > 4:
+        return word[:-2]
+    if word.endswith("ches") or word.endswith("shes") or word.endswith("xes"):
+        return word[:-2]
+    if word.endswith("ses") and len(word) > 4:
+        return word[:-2]
+    if word.endswith("s") and len(word) > 3:
+        return word[:-1]
+    return word
+
+def _build_index(products: List[Product]) -> List[dict]:
+    """Precompute the string work the chat matcher needs, once per cache load."""
+    index = []
+    for i, p in enumerate(products):
+        title_lower = p.title.lower()
+        index.append({
+            "id": i,
+            "title_lower": title_lower,
+            "title_norm": normalize_word(title_lower),
+            "tokens": frozenset(normalize_word(w) for w in title_lower.split()),
+        })
+    return index
+
+def _build_title_automaton(index: List[dict]) -> Optional[ahocorasick.Automaton]:
+    automaton = ahocorasick.Automaton()
+    for e in index:
+        # blank titles are skipped: they would "occur" in every message
+        if e["title_norm"] and e["title_norm"] not in automaton:
+            automaton.add_word(e["title_norm"], e["id"])
+    if len(automaton) == 0:
+        return None
+    automaton.make_automaton()
+    return automaton
+
+def _build_postings(index: List[dict]) -> Dict[str, List[int]]:
+    postings = defaultdict(list)
+    for e in index:
+        for tok in e["tokens"]:
+            postings[tok].append(e["id"])
+    return dict(postings)
+
+def get_product_index() -> List[dict]:
+    """Index entries for the cached products; entry["id"] is the position in the cache."""
+    return _product_index
+
+def get_title_lookup() -> Dict[str, int]:
+    return _title_lookup
+
+def get_token_postings() -> Dict[str, List[int]]:
+    """Inverted index of normalized title tokens (ids in ascending cache order)."""
+    return _token_postings
+
+def get_title_vocab() -> Dict[str, List[str]]:
+    return _title_vocab
+
+def get_title_automaton() -> Optional[ahocorasick.Automaton]:
+    """None when no product has a non-blank title."""
+    return _title_automaton
+
+def get_categories() -> Tuple[str, ...]:
+    return _categories
+
+def get_categories_display() -> Tuple[str, ...]:
+    """Capitalized category names for listing to the user."""
+    return _categories_display
+
+def get_products_json() -> tuple:
+    """Pre-serialized product list as (body, etag, last_modified)."""
+    return _products_json, _products_etag, _products_last_modified
+
+async def fetch_products(force: bool = False) -> List[Product]:
     """
     Fetch all products from DummyJSON (cached).
-    Returns a list of Product models.
+    Returns a list of Product models. force=True refetches even when cached;
+    if that fails the previous cache is kept.
     """
-    global _products_cache
-    if _products_cache is not None:
+    if _products_cache is not None and not force:
         return _products_cache
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(str(settings.DUMMYJSON_URL), timeout=15) as resp:
-                resp.raise_for_status()
-                data = await resp.json()
-                products_list = data.get("products", data)
-                _products_cache = [
-                    Product(
-                        id=int(p.get("id")),
-                        title=p.get("title"),
-                        description=p.get("description") or "",
-                        price=float(p.get("price") or 0.0),
-                        discountPercentage=float(p.get("discountPercentage", 0.0) or 0.0),
-                        rating=float(p.get("rating", 0.0) or 0.0),
-                        stock=int(p.get("stock", 0) or 0),
-                        brand=p.get("brand"),
-                        category=p.get("category"),
-                        thumbnail=p.get("thumbnail")
-                    ) for p in products_list
-                ]
-                return _products_cache
-        except Exception as e:
-            # In production log this; for now print so devs see the error.
-            print(f"[product_service] Error fetching products: {e}")
-            return []
+    async with _fetch_lock:
+        # another request may have filled the cache while we waited
+        if _products_cache is not None and not force:
+            return _products_cache
+        async with aiohttp.ClientSession() as session:
+            try:
+                async with session.get(str(settings.DUMMYJSON_URL), timeout=15) as resp:
+                    resp.raise_for_status()
+                    data = await resp.json(loads=orjson.loads)
+                    products_list = data.get("products", data)
+                    _load_cache(_PRODUCTS_ADAPTER.validate_python(products_list))
+                    return _products_cache
+            except Exception as e:
+                # In production log this; for now print so devs see the error.
+                print(f"[product_service] Error fetching products: {e}")
+                return _products_cache or []
+
+async def _refresh_forever() -> None:
+    while True:
+        await fetch_products(force=True)
+        await asyncio.sleep(settings.PRODUCTS_CACHE_TTL)
+
+def start_refresher() -> None:
+    """Warm the cache now and refresh it every PRODUCTS_CACHE_TTL seconds in the background."""
+    global _refresher
+    if _refresher is None:
+        _refresher = asyncio.create_task(_refresh_forever())
+
+async def stop_refresher() -> None:
+    global _refresher
+    if _refresher is not None:
+        _refresher.cancel()
+        await asyncio.gather(_refresher, return_exceptions=True)
+    _refresher = None
+
+def _load_cache(products: List[Product]) -> None:
+    """Install a freshly fetched product list and rebuild every derived index."""
+    global _products_cache, _product_index, _title_lookup, _token_postings, _title_vocab, _title_automaton
+    global _categories, _categories_display, _products_by_category
+    global _prices, _ratings
+    global _products_json, _products_etag, _products_last_modified
+    _product_index = _build_index(products)
+    _title_lookup = {}
+    for e in _product_index:
+        _title_lookup.setdefault(e["title_lower"], e["id"])
+    _token_postings = _build_postings(_product_index)
+    vocab = defaultdict(list)
+    for tok in _token_postings:
+        vocab[tok[0]].append(tok)
+    _title_vocab = dict(vocab)
+    _title_automaton = _build_title_automaton(_product_index)
+    by_category = defaultdict(list)
+    for p in products:
+        # keyed like search_by_category compares, so a missing category is ""
+        by_category[(p.category or "").lower()].append(p)
+    _products_by_category = dict(by_category)
+    _categories = tuple(sorted(set((p.category or "unknown").lower() for p in products)))
+    _categories_display = tuple(sorted(set((p.category or "unknown").capitalize() for p in products)))
+    _prices = np.array([p.price for p in products], dtype=np.float64)
+    _ratings = np.array([p.rating or 0.0 for p in products], dtype=np.float64)
+    _products_json = orjson.dumps([p.model_dump() for p in products])
+    etag = '"' + hashlib.blake2b(_products_json, digest_size=16).hexdigest() + '"'
+    if etag != _products_etag:
+        # an unchanged refresh keeps its Last-Modified so client caches stay valid
+        _products_etag = etag
+        _products_last_modified = formatdate(usegmt=True)
+    _products_cache = products
 
 def compute_actual_price(price: float, discount_pct: float) -> float:
     """Compute price after discount, rounded to 2 decimals."""
@@ -66,9 +220,21 @@ def search_by_category(products: List[Product], category: str) -> List[Product]:
     c = (category or "").strip().lower()
     if not c:
         return []
+    if products is _products_cache:
+        return _products_by_category.get(c, [])
     return [p for p in products if (p.category or "").lower() == c]
 
 def filter_products(products: List[Product], min_price: float = None, max_price: float = None, min_rating: float = None) -> List[Product]:
+    if products is _products_cache:
+        # one vectorized boolean-mask pass over the cached numeric columns
+        mask = np.ones(len(products), dtype=bool)
+        if min_price is not None:
+            mask &= _prices >= min_price
+        if max_price is not None:
+            mask &= _prices <= max_price
+        if min_rating is not None:
+            mask &= _ratings >= min_rating
+        return [products[i] for i in np.flatnonzero(mask)]
     out = products
     if min_price is not None:
         out = [p for p in out if p.price >= min_price]
@@ -4,38 +4,228 @@ Groq API helper with retries and a robust fallback.
 This module tries to call the Groq (OpenAI-compatible) chat completions endpoint.
 If the API is unreachable or the response is malformed, a friendly fallback
 string is returned so the chatbot can still answer.
+
+Requests go through a single shared aiohttp session (opened on app startup) so
+the event loop is never blocked and connections are kept alive between calls.
+Successful replies are cached by prompt hash: in Redis when REDIS_URL is set,
+otherwise (or while Redis is unreachable) in a small in-process TTL cache. Cache misses go through GroqBatcher,
+which coalesces concurrent calls arriving within a few milliseconds.
 """
+import asyncio
+import hashlib
+import logging
 import time
-import requests
-from typing import Optional
+import aiohttp
+import orjson
+import redis.asyncio as aioredis
+from typing import Dict, List, Optional, Set, Tuple
 from app.core.config import settings
 
-def query_groq(prompt: str, model: Optional[str] = None, temperature: float = 0.7, max_retries: int = 3) -> str:
-    model = model or settings.GROQ_MODEL
+logger = logging.getLogger(__name__)
+
+FALLBACK_REPLY = "Sorry — I couldn't reach the AI service right now. I can still give you a quick product summary if you want."
+EMPTY_REPLY = "Sorry — the AI returned an empty response."
+
+# shared HTTP session, created by init_http_session() on FastAPI startup
+_http: Optional[aiohttp.ClientSession] = None
+
+# reply cache backends
+_redis: Optional[aioredis.Redis] = None
+_local_cache: Dict[str, Tuple[float, str]] = {}
+_LOCAL_CACHE_MAX = 1024
+# a slow or unreachable Redis must not hold up chat replies: short socket
+# timeouts, and after a failure Redis is skipped for _REDIS_COOLDOWN seconds
+_REDIS_TIMEOUT = 0.2
+_REDIS_COOLDOWN = 30.0
+_redis_down_until = 0.0
+
+async def init_http_session() -> aiohttp.ClientSession:
+    """Open the shared keep-alive session (idempotent)."""
+    global _http
+    if _http is None or _http.closed:
+        _http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300))
+    return _http
+
+async def close_http_session() -> None:
+    """Close the shared session on shutdown."""
+    global _http
+    if _http is not None and not _http.closed:
+        await _http.close()
+    _http = None
+
+async def close_cache() -> None:
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+    _redis = None
+
+def _cache_key(prompt: str, model: str, temperature: float) -> str:
+    raw = f"{model}\0{temperature}\0{prompt}".encode()
+    return "groq:" + hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+def _get_redis() -> Optional[aioredis.Redis]:
+    """The Redis client, or None when REDIS_URL is unset or Redis recently failed."""
+    global _redis
+    if not settings.REDIS_URL or time.monotonic() < _redis_down_until:
+        return None
+    if _redis is None:
+        _redis = aioredis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_connect_timeout=_REDIS_TIMEOUT,
+            socket_timeout=_REDIS_TIMEOUT,
+        )
+    return _redis
+
+def _redis_failed(op: str, exc: Exception) -> None:
+    global _redis_down_until
+    # one warning per outage; the in-process cache stands in until the cooldown ends
+    logger.warning("[groq_client] Redis %s failed, skipping it for %.0fs: %s", op, _REDIS_COOLDOWN, exc)
+    _redis_down_until = time.monotonic() + _REDIS_COOLDOWN
+
+async def _cache_get(key: str) -> Optional[str]:
+    redis = _get_redis()
+    if redis is not None:
+        try:
+            return await redis.get(key)
+        except Exception as exc:
+            # Redis down: behave as a cache miss and call Groq directly
+            _redis_failed("get", exc)
+            return None
+    hit = _local_cache.get(key)
+    if hit is None:
+        return None
+    expires_at, reply = hit
+    if expires_at < time.monotonic():
+        _local_cache.pop(key, None)
+        return None
+    return reply
+
+async def _cache_set(key: str, reply: str) -> None:
+    redis = _get_redis()
+    if redis is not None:
+        try:
+            await redis.setex(key, settings.GROQ_CACHE_TTL, reply)
+            return
+        except Exception as exc:
+            _redis_failed("setex", exc)
+    if len(_local_cache) >= _LOCAL_CACHE_MAX:
+        # dicts keep insertion order, so this drops the oldest entry
+        _local_cache.pop(next(iter(_local_cache)))
+    _local_cache[key] = (time.monotonic() + settings.GROQ_CACHE_TTL, reply)
+
+async def _complete(prompt: str, model: str, temperature: float, max_retries: int) -> Optional[str]:
+    """Call Groq with retries; returns the reply text, or None if every attempt failed."""
     url = str(settings.GROQ_API_URL)
     headers = {
         "Authorization": f"Bearer {settings.GROQ_API_KEY}",
         "Content-Type": "application/json",
     }
-    payload = {
+    payload = orjson.dumps({
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
         "temperature": temperature,
         "max_tokens": 512
-    }
+    })
+    # lazily open the session if the startup hook did not run (e.g. scripts)
+    session = await init_http_session()
 
     for attempt in range(1, max_retries + 1):
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=12)
-            resp.raise_for_status()
-            data = resp.json()
+            async with session.post(url, headers=headers, data=payload, timeout=aiohttp.ClientTimeout(total=12)) as resp:
+                resp.raise_for_status()
+                data = await resp.json(loads=orjson.loads)
             # The Groq / OpenAI-compatible response shape:
-            return data.get("choices", [{}])[0].get("message", {}).get("content", "").strip() or \
-                   "Sorry — the AI returned an empty response."
-        except Exception as exc:
+            return data.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+        except Exception:
             # brief exponential-ish backoff
-            time.sleep(0.5 * attempt)
-            last_exc = exc
+            await asyncio.sleep(0.5 * attempt)
+    return None
+
+class GroqBatcher:
+    """
+    Micro-batcher for Groq calls.
+
+    submit() enqueues a request and awaits its Future. A background task
+    drains the queue in batches of up to max_batch items (waiting at most
+    max_wait_ms after the first one), sends identical requests only once,
+    and fires the rest concurrently over the shared session. Batches are
+    dispatched without waiting for the previous one to finish, so a slow
+    Groq reply never holds up the queue.
+    """
+
+    def __init__(self, max_batch: int = 8, max_wait_ms: float = 15):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, *self._inflight, return_exceptions=True)
+        self._worker = None
+        self._queue = None
+
+    async def submit(self, prompt: str, model: str, temperature: float, max_retries: int) -> Optional[str]:
+        if self._worker is None:
+            # not started (e.g. used from a script): call Groq directly
+            return await _complete(prompt, model, temperature, max_retries)
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put(((prompt, model, temperature, max_retries), fut))
+        return await fut
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[tuple]) -> None:
+        groups: Dict[tuple, List[asyncio.Future]] = {}
+        for args, fut in batch:
+            groups.setdefault(args, []).append(fut)
+        results = await asyncio.gather(*[_complete(*args) for args in groups], return_exceptions=True)
+        for futs, result in zip(groups.values(), results):
+            for fut in futs:
+                if fut.done():  # caller gave up (cancelled)
+                    continue
+                if isinstance(result, BaseException):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+
+batcher = GroqBatcher()
+
+async def query_groq(prompt: str, model: Optional[str] = None, temperature: float = 0.7, max_retries: int = 3) -> str:
+    model = model or settings.GROQ_MODEL
+    key = _cache_key(prompt, model, temperature)
+    cached = await _cache_get(key)
+    if cached is not None:
+        return cached
 
-    # Final graceful fallback: a short safe reply (not empty) so the higher layer can continue.
-    return "Sorry — I couldn't reach the AI service right now. I can still give you a quick product summary if you want."
+    reply = await batcher.submit(prompt, model, temperature, max_retries)
+    if reply is None:
+        # Final graceful fallback: a short safe reply (not empty) so the higher layer can continue.
+        return FALLBACK_REPLY
+    if not reply:
+        return EMPTY_REPLY
+    await _cache_set(key, reply)
+    return reply